@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import boto3
+import logging
+from typing import Dict, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Model ID
+MODEL_ID = "amazon.nova-micro-v1:0"
+
+# S3 location and IAM service role used by Bedrock batch inference jobs
+BATCH_BUCKET = os.environ.get("BEDROCK_BATCH_BUCKET", "")
+BATCH_PREFIX = os.environ.get("BEDROCK_BATCH_PREFIX", "bedrock-batch")
+BATCH_ROLE_ARN = os.environ.get("BEDROCK_BATCH_ROLE_ARN", "")
+
+# Bedrock rejects jobs with fewer records than this per-model quota
+BATCH_MIN_RECORDS = int(os.environ.get("BEDROCK_BATCH_MIN_RECORDS", "100"))
+
+# Job states after which a batch job will not change any more
+TERMINAL_STATES = {"Completed", "PartiallyCompleted", "Failed", "Stopped", "Expired"}
+
+# Bedrock requires record IDs to be 11 character alphanumeric strings
+RECORD_ID_LENGTH = 11
+
+
+def record_id(index: int) -> str:
+    """Return the batch record ID for a prompt index"""
+    return f"{index:0{RECORD_ID_LENGTH}d}"
+
+
+def submit(prompts: List[str], record_ids: Optional[List[str]] = None,
+           model_id: str = MODEL_ID, inference_config: Optional[Dict] = None) -> str:
+    """
+    Submit prompts as a Bedrock batch inference job
+
+    Writes one JSONL record per prompt to S3 and starts a model invocation job.
+    Bedrock requires a minimum number of records per job, see BATCH_MIN_RECORDS.
+
+    Args:
+        prompts (List[str]): Prompts to run
+        record_ids (Optional[List[str]]): 11 character alphanumeric record IDs matching prompts, defaults to the prompt index
+        model_id (str): Amazon Bedrock model ID
+        inference_config (Optional[Dict]): Inference parameters applied to every record
+
+    Returns:
+        str: Job ARN identifying the batch job
+    """
+    if not BATCH_BUCKET or not BATCH_ROLE_ARN:
+        raise ValueError("BEDROCK_BATCH_BUCKET and BEDROCK_BATCH_ROLE_ARN must be set for batch inference")
+    if len(prompts) < BATCH_MIN_RECORDS:
+        raise ValueError(f"Batch inference needs at least {BATCH_MIN_RECORDS} records, got {len(prompts)}")
+
+    if record_ids is None:
+        record_ids = [record_id(i) for i in range(len(prompts))]
+    elif any(len(rid) != RECORD_ID_LENGTH or not rid.isalnum() for rid in record_ids):
+        raise ValueError(f"Batch record IDs must be {RECORD_ID_LENGTH} character alphanumeric strings")
+
+    lines = []
+    for rid, prompt in zip(record_ids, prompts):
+        model_input = {
+            "schemaVersion": "messages-v1",
+            "messages": [{
+                "role": "user",
+                "content": [{"text": prompt}]
+            }]
+        }
+        if inference_config:
+            model_input["inferenceConfig"] = inference_config
+        lines.append(json.dumps({"recordId": rid, "modelInput": model_input}, ensure_ascii=False))
+
+    job_name = f"language-learning-{int(time.time())}"
+    input_key = f"{BATCH_PREFIX}/{job_name}/input.jsonl"
+    output_uri = f"s3://{BATCH_BUCKET}/{BATCH_PREFIX}/{job_name}/output/"
+
+    boto3.client('s3', region_name="us-east-1").put_object(
+        Bucket=BATCH_BUCKET,
+        Key=input_key,
+        Body="\n".join(lines).encode('utf-8')
+    )
+
+    response = boto3.client('bedrock', region_name="us-east-1").create_model_invocation_job(
+        jobName=job_name,
+        modelId=model_id,
+        roleArn=BATCH_ROLE_ARN,
+        inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{BATCH_BUCKET}/{input_key}"}},
+        outputDataConfig={"s3OutputDataConfig": {"s3Uri": output_uri}}
+    )
+    logger.info(f"Submitted batch job {job_name} with {len(lines)} records")
+    return response["jobArn"]
+
+
+def wait(job_arn: str, poll_interval: int = 60) -> str:
+    """
+    Poll a batch inference job until it reaches a terminal state
+
+    Args:
+        job_arn (str): Job ARN returned by submit
+        poll_interval (int): Seconds between status checks
+
+    Returns:
+        str: Final job status
+    """
+    bedrock = boto3.client('bedrock', region_name="us-east-1")
+    while True:
+        status = bedrock.get_model_invocation_job(jobIdentifier=job_arn)["status"]
+        if status in TERMINAL_STATES:
+            logger.info(f"Batch job finished with status {status}")
+            return status
+        logger.info(f"Batch job status: {status}")
+        time.sleep(poll_interval)
+
+
+def read_results(job_arn: str) -> Dict[str, Optional[str]]:
+    """
+    Read the model output of a finished batch inference job
+
+    Args:
+        job_arn (str): Job ARN returned by submit
+
+    Returns:
+        Dict[str, Optional[str]]: Response text per record ID, None for failed records
+    """
+    job = boto3.client('bedrock', region_name="us-east-1").get_model_invocation_job(jobIdentifier=job_arn)
+    output_uri = job["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
+    input_uri = job["inputDataConfig"]["s3InputDataConfig"]["s3Uri"]
+
+    # Bedrock writes <output uri>/<job id>/<input file name>.out
+    bucket, _, prefix = output_uri[len("s3://"):].partition("/")
+    job_id = job_arn.rsplit("/", 1)[-1]
+    key = f"{prefix.rstrip('/')}/{job_id}/{input_uri.rsplit('/', 1)[-1]}.out"
+
+    body = boto3.client('s3', region_name="us-east-1").get_object(Bucket=bucket, Key=key)["Body"]
+
+    results = {}
+    for line in body.iter_lines():
+        if not line:
+            continue
+        record = json.loads(line)
+        try:
+            results[record["recordId"]] = record["modelOutput"]["output"]["message"]["content"][0]["text"]
+        except (KeyError, IndexError):
+            logger.error(f"Batch record {record.get('recordId')} failed: {record.get('error')}")
+            results[record["recordId"]] = None
+    return results
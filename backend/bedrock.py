@@ -0,0 +1,23 @@
+import boto3
+from botocore.config import Config
+
+# Shared Bedrock runtime client - building a client is expensive, so every module
+# reuses this one. The pool is sized for the embedding and structuring thread pools,
+# adaptive retries back off on throttling.
+client = boto3.client(
+    'bedrock-runtime',
+    region_name="us-east-1",
+    config=Config(
+        max_pool_connections=64,
+        retries={'max_attempts': 10, 'mode': 'adaptive'},
+        connect_timeout=5,
+        read_timeout=60,
+        tcp_keepalive=True
+    )
+)
+
+
+def latency_unsupported(error: Exception) -> bool:
+    """Whether a ValidationException rejected the requested performanceConfig latency"""
+    message = str(error).lower()
+    return "performanceconfig" in message or "latency" in message
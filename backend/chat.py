@@ -1,10 +1,15 @@
 # Create BedrockChat
 # bedrock_chat.py
-import boto3
 import streamlit as st
 from typing import Optional, Dict, Any
 import logging
 
+# Works both when run as a script from backend/ and when imported as backend.chat
+try:
+    from . import bedrock
+except ImportError:
+    import bedrock
+
 # Set up logging at the top of the file
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,12 +18,12 @@ logger = logging.getLogger(__name__)
 MODEL_ID = "amazon.nova-micro-v1:0"
 
 
-
 class BedrockChat:
-    def __init__(self, model_id: str = MODEL_ID):
+    def __init__(self, model_id: str = MODEL_ID, latency: str = "optimized"):
         """Initialize Bedrock chat client"""
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name="us-east-1")
+        self.bedrock_client = bedrock.client
         self.model_id = model_id
+        self.latency = latency
 
     def generate_response(self, message: str, inference_config: Optional[Dict[str, Any]] = None) -> Optional[str]:
         """Generate a response using Amazon Bedrock"""
@@ -31,11 +36,26 @@ class BedrockChat:
         }]
 
         try:
-            response = self.bedrock_client.converse(
-                modelId=self.model_id,
-                messages=messages,
-                inferenceConfig=inference_config
-            )
+            try:
+                response = self.bedrock_client.converse(
+                    modelId=self.model_id,
+                    messages=messages,
+                    inferenceConfig=inference_config,
+                    performanceConfig={"latency": self.latency}
+                )
+            except self.bedrock_client.exceptions.ValidationException as e:
+                # Latency-optimized inference is not available for every model/region,
+                # other validation errors would fail the same way with standard latency
+                if self.latency == "standard" or not bedrock.latency_unsupported(e):
+                    raise
+                logger.warning("Latency-optimized inference unavailable, falling back to standard")
+                self.latency = "standard"
+                response = self.bedrock_client.converse(
+                    modelId=self.model_id,
+                    messages=messages,
+                    inferenceConfig=inference_config,
+                    performanceConfig={"latency": self.latency}
+                )
             return response['output']['message']['content'][0]['text']
             
         except Exception as e:
@@ -1,7 +1,17 @@
-from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api import YouTubeTranscriptApi, TooManyRequests
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from typing import Optional, List, Dict
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import requests
 import sys
+import re
+
+# Matches the 11-character video ID in watch and short youtu.be URLs
+_VID_RE = re.compile(r'(?:v=|youtu\.be/)([\w-]{11})')
+
+# Errors worth retrying: YouTube throttling and transient network failures
+_RETRYABLE_ERRORS = (TooManyRequests, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
 
 
 class YouTubeTranscriptDownloader:
@@ -18,11 +28,8 @@ class YouTubeTranscriptDownloader:
         Returns:
             Optional[str]: Video ID if found, None otherwise
         """
-        if "v=" in url:
-            return url.split("v=")[1][:11]
-        elif "youtu.be/" in url:
-            return url.split("youtu.be/")[1][:11]
-        return None
+        m = _VID_RE.search(url)
+        return m.group(1) if m else None
 
     def get_transcript(self, video_id: str) -> Optional[List[Dict]]:
         """
@@ -45,11 +52,31 @@ class YouTubeTranscriptDownloader:
         print(f"Downloading transcript for video ID: {video_id}")
         
         try:
-            return YouTubeTranscriptApi.get_transcript(video_id, languages=self.languages)
+            return self._fetch_transcript(video_id)
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             return None
 
+    @retry(wait=wait_exponential_jitter(1, 30), stop=stop_after_attempt(6),
+           retry=retry_if_exception_type(_RETRYABLE_ERRORS), reraise=True)
+    def _fetch_transcript(self, video_id: str) -> List[Dict]:
+        """Fetch a transcript, retrying throttled or failed requests with exponential backoff"""
+        return YouTubeTranscriptApi.get_transcript(video_id, languages=self.languages)
+
+    def get_many(self, urls: List[str], max_workers: int = 8) -> Dict[str, Optional[List[Dict]]]:
+        """
+        Download several transcripts concurrently
+        
+        Args:
+            urls (List[str]): YouTube video IDs or URLs
+            max_workers (int): Maximum concurrent downloads, kept low to respect YouTube rate limits
+            
+        Returns:
+            Dict[str, Optional[List[Dict]]]: Transcript per input URL, None where the download failed
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(urls, executor.map(self.get_transcript, urls)))
+
     def save_transcript(self, transcript: List[Dict], filename: str) -> bool:
         """
         Save transcript to file
@@ -64,9 +91,9 @@ class YouTubeTranscriptDownloader:
         filename = f"./transcripts/{filename}.txt"
         
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                for entry in transcript:
-                    f.write(f"{entry['text']}\n")
+            # Build the whole payload once and write it in a single call
+            with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                f.write("".join(entry['text'] + "\n" for entry in transcript))
             return True
         except Exception as e:
             print(f"Error saving transcript: {str(e)}")
@@ -75,20 +102,21 @@ class YouTubeTranscriptDownloader:
 def main():
     # Check if help is requested directly
     if '--help' in sys.argv or '-h' in sys.argv:
-        print("Usage: python get_transcript.py [OPTIONS] URL")
+        print("Usage: python get_transcript.py [OPTIONS] URL [URL ...]")
         print("\nOptions:")
         print("  --print, -p    Print transcript to console")
         print("  --help, -h     Show this help message")
         print("\nExamples:")
         print("  python get_transcript.py https://www.youtube.com/watch?v=VIDEO_ID")
         print("  python get_transcript.py -p https://www.youtube.com/watch?v=VIDEO_ID")
+        print("  python get_transcript.py https://youtu.be/VIDEO_ID_1 https://youtu.be/VIDEO_ID_2")
         return
 
     # Set up argument parser for other cases
     parser = argparse.ArgumentParser(description='Download YouTube video transcripts')
     
     # Add arguments
-    parser.add_argument('url', help='YouTube video URL')
+    parser.add_argument('url', nargs='+', help='YouTube video URL(s)')
     parser.add_argument('--print', '-p', action='store_true', 
                        help='Print transcript to console')
     
@@ -98,21 +126,22 @@ def main():
     # Initialize downloader
     downloader = YouTubeTranscriptDownloader()
     
-    # Get transcript
-    transcript = downloader.get_transcript(args.url)
-    if transcript:
-        # Save transcript
-        video_id = downloader.extract_video_id(args.url)
-        if downloader.save_transcript(transcript, video_id):
-            print(f"Transcript saved successfully to {video_id}.txt")
-            # Print transcript if --print flag is used
-            if args.print:
-                for entry in transcript:
-                    print(f"{entry['text']}")
+    # Get transcripts, downloading multiple URLs concurrently
+    transcripts = downloader.get_many(args.url)
+    for url, transcript in transcripts.items():
+        if transcript:
+            # Save transcript
+            video_id = downloader.extract_video_id(url)
+            if downloader.save_transcript(transcript, video_id):
+                print(f"Transcript saved successfully to {video_id}.txt")
+                # Print transcript if --print flag is used
+                if args.print:
+                    for entry in transcript:
+                        print(f"{entry['text']}")
+            else:
+                print("Failed to save transcript")
         else:
-            print("Failed to save transcript")
-    else:
-        print("Failed to get transcript")
+            print(f"Failed to get transcript for {url}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,87 @@
+from typing import Tuple
+
+
+class JsonObjectScanner:
+    """
+    Track brace depth over streamed text to find where the response's JSON object starts and ends
+
+    The object is the first one after a ```json fence, or the first one in the text if there is
+    no fence. An unfenced object only ends the scan when nothing but whitespace precedes it,
+    prose before it may still be followed by the fenced object.
+    """
+
+    FENCE = "```json"
+
+    def __init__(self):
+        self.depth = 0
+        self.start = -1
+        self.end = -1
+        self.offset = 0
+        self.in_string = False
+        self.escaped = False
+        self.fenced = False
+        # Only whitespace seen before the object
+        self.leading = True
+        # Last characters outside of strings, so a fence split across chunks is still found
+        self.recent = ""
+
+    def feed(self, text: str) -> bool:
+        """Consume a chunk of text, returning True once the response's object is known to be complete"""
+        base = self.offset
+        self.offset += len(text)
+        for i, char in enumerate(text, base):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if not self.fenced:
+                self.recent = (self.recent + char)[-len(self.FENCE):]
+                if self.recent == self.FENCE:
+                    # Start over on the fenced object
+                    self.fenced = True
+                    self.depth = 0
+                    self.start = self.end = -1
+                    continue
+            if self.end != -1:
+                # An unfenced object was found, only a later fence can replace it
+                continue
+            if char == '"':
+                self.in_string = self.start != -1
+            elif char == "{":
+                self.depth += 1
+                if self.start == -1:
+                    self.start = i
+            elif char == "}" and self.start != -1:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = i + 1
+                    if self.fenced or self.leading:
+                        return True
+            elif self.start == -1 and not char.isspace():
+                self.leading = False
+        return False
+
+
+def extract_json_span(text: str) -> Tuple[int, int]:
+    """
+    Find the JSON object in a model response in one linear pass
+    
+    Takes the first object after a ```json fence if there is one, otherwise the
+    first object, counting braces outside of string literals until it closes.
+    Uses the same scanner as the streaming early stop, so both agree on the object.
+    
+    Args:
+        text (str): Model response text
+        
+    Returns:
+        Tuple[int, int]: Start and end index of the object, (-1, -1) if there is none
+    """
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    if scanner.end == -1:
+        return -1, -1
+    return scanner.start, scanner.end
@@ -1,33 +1,139 @@
-import json
+import orjson
+import random
 import logging
-import boto3
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
 from .rag import TranscriptVectorStore
+from . import batch, bedrock
+from .json_scanner import JsonObjectScanner, extract_json_span
 
-# Set up logging
+# Set up logging, this module logs on the request path so it defaults to WARNING.
+# basicConfig is a no-op once rag has configured the root logger, so set the level here.
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+
+# Fields every generated question must contain
+_REQUIRED_FIELDS = frozenset(("conversation", "question_spanish", "question_english", "answers"))
+
+# Contexts with fewer lines are unlikely to be complete conversations
+MIN_CONTEXT_LINES = 3
+
+# Shared worker pool for fanning out concurrent Bedrock calls
+_EXECUTOR = ThreadPoolExecutor(max_workers=16)
+
+def build_question_prompt(context: str, question_type: str) -> str:
+    """
+    Build the question generation prompt for a reference conversation
+    
+    Args:
+        context (str): Reference conversation to base the question on
+        question_type (str): Type of question to generate
+        
+    Returns:
+        str: Prompt text
+    """
+    return f"""You are an expert Spanish language teacher. Here's a sample conversation for reference:
+
+{context}
+
+Create a NEW conversation following a similar pattern but with different:
+- Names
+- Numbers
+- Places
+- Professions
+- Details
+
+The new conversation should:
+- Be at A1 level Spanish
+- Use similar grammar structures
+- Cover similar topics
+- Be about 3-4 lines long
+- Include personal information (name, age, job, etc.)
+- Include some numbers and locations
+
+After creating the conversation, generate a {question_type} multiple choice question about it.
+
+Return your response in this exact JSON format:
+{{
+    "conversation": "your new conversation in Spanish",
+    "question_spanish": "your question about the NEW conversation in Spanish",
+    "question_english": "English translation of your question",
+    "answers": [
+        {{
+            "text_spanish": "correct answer in Spanish",
+            "text_english": "correct answer in English",
+            "is_correct": true
+        }},
+        {{
+            "text_spanish": "first incorrect answer in Spanish",
+            "text_english": "first incorrect answer in English",
+            "is_correct": false
+        }},
+        {{
+            "text_spanish": "second incorrect answer in Spanish",
+            "text_english": "second incorrect answer in English",
+            "is_correct": false
+        }},
+        {{
+            "text_spanish": "third incorrect answer in Spanish",
+            "text_english": "third incorrect answer in English",
+            "is_correct": false
+        }}
+    ]
+}}"""
+
+def parse_question_response(response_text: str) -> Optional[Dict]:
+    """
+    Parse the question JSON out of a model response
+    
+    Args:
+        response_text (str): Raw model response text
+        
+    Returns:
+        Optional[Dict]: Question data if valid JSON was found, None otherwise
+    """
+    try:
+        # Parse only the JSON object, text around it may contain braces too
+        start, end = extract_json_span(response_text)
+        if start != -1:
+            question_data = orjson.loads(response_text[start:end])
+            if isinstance(question_data, dict) and _REQUIRED_FIELDS <= question_data.keys():
+                return question_data
+        
+        logger.error("Could not extract valid JSON from response")
+        logger.error(f"Response text: {response_text}")
+        return None
+        
+    except Exception as e:
+        logger.error(f"Error processing response: {str(e)}")
+        logger.error(f"Response text: {response_text}")
+        return None
+
 
 class LanguageLearningAssistant:
-    def __init__(self, model_id="amazon.nova-micro-v1:0"):
+    def __init__(self, model_id="amazon.nova-micro-v1:0", latency="optimized", cache_questions=False):
         """
         Initialize the Language Learning Assistant
         
         Args:
             model_id (str): Amazon Bedrock model ID for question generation
+            latency (str): Bedrock inference latency mode ("optimized" or "standard")
+            cache_questions (bool): Reuse questions generated for near-identical prompts
         """
         # Initialize vector store
         self.vector_store = TranscriptVectorStore()
         
         # Debug: Print all documents in the vector store
-        try:
-            results = self.vector_store.collection.get()
-            logger.info("Documents in vector store:")
-            for doc, metadata in zip(results['documents'], results['metadatas']):
-                logger.info(f"Document: {doc[:100]}...")
-                logger.info(f"Metadata: {metadata}")
-        except Exception as e:
-            logger.error(f"Error getting documents: {e}")
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                results = self.vector_store.collection.get()
+                logger.debug("Documents in vector store:")
+                for doc, metadata in zip(results['documents'], results['metadatas']):
+                    logger.debug("Document: %s...", doc[:100])
+                    logger.debug("Metadata: %s", metadata)
+            except Exception as e:
+                logger.error(f"Error getting documents: {e}")
         
         # Process transcripts if vector store is empty
         if self.vector_store.collection.count() == 0:
@@ -40,9 +146,15 @@ class LanguageLearningAssistant:
         else:
             logger.info(f"Vector store contains {self.vector_store.collection.count()} documents")
         
-        # Initialize Bedrock client
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name="us-east-1")
+        # Use the shared Bedrock client
+        self.bedrock_client = bedrock.client
         self.model_id = model_id
+        self.latency = latency
+        self.cache_questions = cache_questions
+        
+        # Conversation templates, reloaded whenever the vector store changes
+        self._templates = []
+        self._templates_version = None
 
     def retrieve_similar_context(self, query: str, n_results: int = 3) -> List[str]:
         """
@@ -56,11 +168,15 @@ class LanguageLearningAssistant:
             List[str]: List of similar context documents
         """
         try:
-            # Get similar documents without filtering
-            results = self.vector_store.query_similar(query, n_results)
+            # Get similar documents long enough to be conversations, using vector and keyword scores
+            results = self.vector_store.hybrid_query(
+                query,
+                n_results,
+                {"line_count": {"$gte": MIN_CONTEXT_LINES}}
+            )
             
             # Debug: Log full results
-            logger.info(f"Query results: {results}")
+            logger.debug("Query results: %s", results)
             
             # Extract documents from results
             similar_contexts = results.get('documents', [[]])[0]
@@ -69,18 +185,13 @@ class LanguageLearningAssistant:
             # Process each context
             processed_contexts = []
             for context in similar_contexts:
-                logger.info(f"Processing context: {context[:100]}...")  # Log first 100 chars
-                
-                # If the context is too short, it might not be a complete conversation
-                if len(context.split('\n')) < 3:
-                    logger.info("Context too short, skipping")
-                    continue
+                logger.debug("Processing context: %.100s...", context)
                 
                 # Clean up the context
                 cleaned_context = context.strip()
                 if cleaned_context:
                     processed_contexts.append(cleaned_context)
-                    logger.info("Added context to processed list")
+                    logger.debug("Added context to processed list")
             
             # If we have contexts, combine them
             if processed_contexts:
@@ -95,142 +206,115 @@ class LanguageLearningAssistant:
             logger.error(f"Error retrieving similar context: {str(e)}")
             return []
 
-    def generate_question(self, context: str, question_type: str) -> Optional[Dict]:
+    def generate_question(self, context: str, question_type: str,
+                          on_text: Optional[Callable[[str], None]] = None) -> Optional[Dict]:
         """
         Generate a language learning question using Bedrock Nova Micro
         
+        The response is streamed, so callers can show progress as soon as the
+        first tokens arrive.
+        
         Args:
             context (str): Context to base the question on
             question_type (str): Type of question to generate
+            on_text (Optional[Callable[[str], None]]): Called with each streamed text chunk
             
         Returns:
             Optional[Dict]: Generated question data if successful, None otherwise
         """
-        prompt = f"""You are an expert Spanish language teacher. Here's a sample conversation for reference:
-
-{context}
-
-Create a NEW conversation following a similar pattern but with different:
-- Names
-- Numbers
-- Places
-- Professions
-- Details
-
-The new conversation should:
-- Be at A1 level Spanish
-- Use similar grammar structures
-- Cover similar topics
-- Be about 3-4 lines long
-- Include personal information (name, age, job, etc.)
-- Include some numbers and locations
+        prompt = build_question_prompt(context, question_type)
 
-After creating the conversation, generate a {question_type} multiple choice question about it.
+        try:
+            # Serve near-duplicate prompts from the semantic cache
+            cache_key = key_embedding = None
+            if self.cache_questions:
+                cache_key = f"{question_type}::{context}"
+                key_embedding = self.vector_store.generate_embedding(cache_key)
+                if key_embedding.size:
+                    cached = self.vector_store.get_cached_question(key_embedding)
+                    if cached:
+                        logger.info("Question cache hit")
+                        return cached
+                else:
+                    key_embedding = None
 
-Return your response in this exact JSON format:
-{{
-    "conversation": "your new conversation in Spanish",
-    "question_spanish": "your question about the NEW conversation in Spanish",
-    "question_english": "English translation of your question",
-    "answers": [
-        {{
-            "text_spanish": "correct answer in Spanish",
-            "text_english": "correct answer in English",
-            "is_correct": true
-        }},
-        {{
-            "text_spanish": "first incorrect answer in Spanish",
-            "text_english": "first incorrect answer in English",
-            "is_correct": false
-        }},
-        {{
-            "text_spanish": "second incorrect answer in Spanish",
-            "text_english": "second incorrect answer in English",
-            "is_correct": false
-        }},
-        {{
-            "text_spanish": "third incorrect answer in Spanish",
-            "text_english": "third incorrect answer in English",
-            "is_correct": false
-        }}
-    ]
-}}"""
+            messages = [{
+                "role": "user",
+                "content": [{"text": prompt}]
+            }]
 
-        try:
-            request_body = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [{"text": prompt}]
-                    }
-                ]
-            }
-
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_id,
-                contentType="application/json",
-                accept="application/json",
-                body=json.dumps(request_body)
-            )
+            try:
+                response = self.bedrock_client.converse_stream(
+                    modelId=self.model_id,
+                    messages=messages,
+                    performanceConfig={"latency": self.latency}
+                )
+            except self.bedrock_client.exceptions.ValidationException as e:
+                # Latency-optimized inference is not available for every model/region,
+                # other validation errors would fail the same way with standard latency
+                if self.latency == "standard" or not bedrock.latency_unsupported(e):
+                    raise
+                logger.warning("Latency-optimized inference unavailable, falling back to standard")
+                self.latency = "standard"
+                response = self.bedrock_client.converse_stream(
+                    modelId=self.model_id,
+                    messages=messages,
+                    performanceConfig={"latency": self.latency}
+                )
             
-            # Extract and parse the response - updated to match Nova's response format
-            response_body = json.loads(response["body"].read())
-            response_text = response_body.get("output", {}).get("message", {}).get("content", [{}])[0].get("text", "").strip()
+            # Collect the streamed text, stopping as soon as the JSON object is complete
+            chunks = []
+            scanner = JsonObjectScanner()
+            stream = response["stream"]
+            for event in stream:
+                if "contentBlockDelta" not in event:
+                    continue
+                text = event["contentBlockDelta"]["delta"].get("text", "")
+                chunks.append(text)
+                if on_text:
+                    on_text(text)
+                if scanner.feed(text):
+                    stream.close()
+                    break
+            response_text = "".join(chunks).strip()
             
-            logger.info(f"Raw response: {response_text}")  # Debug logging
+            logger.debug("Raw response: %s", response_text)
             
-            try:
-                # First try direct JSON parsing
-                try:
-                    return json.loads(response_text)
-                except json.JSONDecodeError:
-                    # If direct parsing fails, try to extract JSON
-                    start = response_text.find("{")
-                    end = response_text.rfind("}") + 1
-                    
-                    if start >= 0 and end > start:
-                        json_str = response_text[start:end]
-                        try:
-                            question_data = json.loads(json_str)
-                            # Validate required fields
-                            required_fields = ["conversation", "question_spanish", "question_english", "answers"]
-                            if all(field in question_data for field in required_fields):
-                                return question_data
-                        except json.JSONDecodeError:
-                            pass
-                    
-                    logger.error("Could not extract valid JSON from response")
-                    logger.error(f"Response text: {response_text}")
-                    return None
-                
-            except Exception as e:
-                logger.error(f"Error processing response: {str(e)}")
-                return None
+            question_data = parse_question_response(response_text)
+            if question_data and key_embedding is not None:
+                self.vector_store.cache_question(cache_key, key_embedding, question_data)
+            return question_data
             
         except Exception as e:
             logger.error(f"Error generating question: {str(e)}")
             return None
 
-    def generate_learning_exercise(self, question_type: str = "comprehension") -> Optional[Dict]:
-        """Generate a complete learning exercise"""
-        try:
-            # Simple query to get any conversation
-            results = self.vector_store.collection.get(
+    def _get_templates(self) -> List[str]:
+        """Get the cached conversation templates, reloading them if the vector store changed"""
+        if self._templates_version != self.vector_store.version:
+            # Prefer conversations, fall back to any documents
+            templates = self.vector_store.collection.get(
                 where={"type": "conversation"}
-            )
-            
-            if not results or not results['documents']:
-                # Try getting any document
-                results = self.vector_store.collection.get(
+            )['documents']
+            if not templates:
+                templates = self.vector_store.collection.get(
                     limit=5
-                )
-                
-            logger.info(f"Got {len(results.get('documents', []))} documents from vector store")
+                )['documents']
+            self._templates = templates
+            self._templates_version = self.vector_store.version
+        return self._templates
+
+    def generate_learning_exercise(self, question_type: str = "comprehension",
+                                   on_text: Optional[Callable[[str], None]] = None) -> Optional[Dict]:
+        """Generate a complete learning exercise, streaming model output to on_text if given"""
+        try:
+            templates = self._get_templates()
+            logger.info(f"Choosing from {len(templates)} template documents")
             
-            if results and results['documents']:
-                # Use the first document as a template
-                template = results['documents'][0]
-                response = self.generate_question(template, question_type)
+            if templates:
+                # Sample a template for more varied questions
+                template = random.choice(templates)
+                response = self.generate_question(template, question_type, on_text)
                 
                 if response and "conversation" in response:
                     return {
@@ -246,4 +330,61 @@ Return your response in this exact JSON format:
             
         except Exception as e:
             logger.error(f"Error in generate_learning_exercise: {e}")
-            return None 
\ No newline at end of file
+            return None 
+
+    def generate_learning_exercises(self, n: int, question_type: str = "comprehension") -> List[Dict]:
+        """
+        Generate several learning exercises concurrently
+        
+        Args:
+            n (int): Number of exercises to generate
+            question_type (str): Type of question to generate
+            
+        Returns:
+            List[Dict]: Successfully generated exercises, in completion order
+        """
+        futures = [
+            _EXECUTOR.submit(self.generate_learning_exercise, question_type)
+            for _ in range(n)
+        ]
+        
+        exercises = []
+        for future in as_completed(futures):
+            exercise = future.result()
+            if exercise:
+                exercises.append(exercise)
+        
+        logger.info(f"Generated {len(exercises)} of {n} exercises")
+        return exercises
+
+    def generate_exercises_batch(self, contexts: List[str], question_type: str = "comprehension") -> List[Dict]:
+        """
+        Generate questions offline through a Bedrock batch inference job
+        
+        Cheaper than online generation for large decks, but blocks until the
+        job finishes, which can take hours.
+        
+        Args:
+            contexts (List[str]): Reference conversations, one question per context
+            question_type (str): Type of question to generate
+            
+        Returns:
+            List[Dict]: Successfully parsed question data
+        """
+        prompts = [build_question_prompt(context, question_type) for context in contexts]
+        job_arn = batch.submit(prompts, model_id=self.model_id)
+        
+        status = batch.wait(job_arn)
+        if status not in ("Completed", "PartiallyCompleted"):
+            logger.error(f"Batch job {job_arn} ended with status {status}")
+            return []
+        
+        questions = []
+        for response_text in batch.read_results(job_arn).values():
+            if response_text:
+                question_data = parse_question_response(response_text.strip())
+                if question_data:
+                    questions.append(question_data)
+        
+        logger.info(f"Generated {len(questions)} of {len(prompts)} questions in batch")
+        return questions
@@ -1,32 +1,164 @@
 import chromadb
 import os
 import json
-import boto3
+import orjson
+import ijson
+import re
+import sqlite3
+import hashlib
+import sys
 import logging
+import queue
+import threading
+import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from collections import OrderedDict
+from itertools import compress
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Set, Tuple, Optional
+from rank_bm25 import BM25Okapi
+
+# Works both when run as a script from backend/ and when imported as backend.rag
+try:
+    from . import bedrock
+except ImportError:
+    import bedrock
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# HNSW index parameters for the transcript collection. They only take effect when
+# the collection is created. A lower construction_ef and M make bulk loading
+# cheaper, search_ef keeps recall up at query time, and batch_size/sync_threshold
+# let the index be persisted every few thousand inserts instead of after each one.
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": int(os.environ.get("HNSW_M", "16")),
+    "hnsw:construction_ef": int(os.environ.get("HNSW_CONSTRUCTION_EF", "80")),
+    "hnsw:search_ef": int(os.environ.get("HNSW_SEARCH_EF", "100")),
+    "hnsw:batch_size": int(os.environ.get("HNSW_BATCH_SIZE", "500")),
+    "hnsw:sync_threshold": int(os.environ.get("HNSW_SYNC_THRESHOLD", "2000"))
+}
+
+# Titan Text Embeddings V2 output size (256, 512 or 1024). Smaller vectors cut
+# index memory and distance cost; changing it requires a fresh collection.
+EMBEDDING_DIMENSIONS = int(os.environ.get("TITAN_EMBEDDING_DIMENSIONS", "1024"))
+
+# Embedding model, Titan V2 by default; a cohere.* model embeds documents in batches
+EMBEDDING_MODEL_ID = os.environ.get("EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
+
+# Cohere Embed V3 limits: texts per request, characters per text and fixed output size
+COHERE_BATCH_SIZE = 96
+COHERE_MAX_CHARS = 2048
+COHERE_EMBEDDING_DIMENSIONS = 1024
+
+# Structured files at least this large are streamed with ijson instead of parsed in one go
+STREAMING_PARSE_THRESHOLD = 64 * 1024
+
+# Top-level keys of a structured transcript that are turned into documents
+STRUCTURED_KEYS = ("introduction", "conversation", "qa_pairs")
+
+# Number of embeddings kept in the in-process cache in front of the on-disk cache
+EMBEDDING_MEMORY_CACHE_SIZE = 4096
+
+# Character window and overlap used to split long sections before embedding
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 200
+
+# Candidates taken from each retriever and the vector share of the hybrid score
+HYBRID_CANDIDATES = 20
+HYBRID_VECTOR_WEIGHT = 0.5
+
+# Minimum cosine similarity for a cached question to count as a hit
+CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Word pattern for BM25 tokens, compiled once since it runs over every document
+_TOKEN_RE = re.compile(r"\w+")
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into overlapping character windows
+    
+    Args:
+        text (str): Text to split
+        size (int): Maximum characters per chunk
+        overlap (int): Characters shared between consecutive chunks
+        
+    Returns:
+        List[str]: Text chunks, a single chunk if the text already fits
+    """
+    if len(text) <= size:
+        return [text]
+    
+    chunks = []
+    step = size - overlap
+    for start in range(0, len(text), step):
+        chunks.append(text[start:start + size])
+        if start + size >= len(text):
+            break
+    return chunks
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenizer used for BM25 scoring"""
+    return _TOKEN_RE.findall(text.lower())
+
+def _min_max(scores: Dict[str, float]) -> Dict[str, float]:
+    """Min-max normalize scores to the 0-1 range, all-zero scores stay 0"""
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {key: 1.0 if high else 0.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
+
 class TranscriptVectorStore:
-    def __init__(self, collection_name="spanish-listening-comprehension"):
+    def __init__(self, collection_name="spanish-listening-comprehension",
+                 embedding_dimensions: int = EMBEDDING_DIMENSIONS,
+                 model_id: str = EMBEDDING_MODEL_ID,
+                 max_parallel_requests: int = 32,
+                 batch_size: int = 200):
         """Initialize ChromaDB client and collection for transcript storage"""
         # Use persistent storage
-        self.client = chromadb.PersistentClient(path="./chroma_db")
+        self.client = chromadb.PersistentClient(path=os.environ.get("CHROMA_DIR", "./chroma_db"))
         
         # Create or get collection
         try:
-            self.collection = self.client.get_or_create_collection(collection_name)
+            self.collection = self.client.get_or_create_collection(
+                collection_name,
+                metadata=HNSW_METADATA
+            )
             logger.info(f"Using collection: {collection_name}")
+            # Semantic cache of generated questions
+            self.question_cache = self.client.get_or_create_collection(
+                "question_cache",
+                metadata={"hnsw:space": "cosine"}
+            )
         except Exception as e:
             logger.error(f"Error getting/creating collection: {str(e)}")
             raise
         
         # Initialize Bedrock client for embeddings
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name="us-east-1")
-        self.model_id = "amazon.titan-embed-text-v2:0"
+        self.bedrock_client = bedrock.client
+        self.model_id = model_id
+        self.is_cohere = model_id.startswith("cohere.")
+        # Cohere Embed V3 has a fixed output size, dimensions only apply to Titan
+        self.embedding_dimensions = COHERE_EMBEDDING_DIMENSIONS if self.is_cohere else embedding_dimensions
+        # Constant part of the Titan request body, only the JSON-encoded text is spliced in per call
+        self._titan_body_suffix = b"," + orjson.dumps({
+            "dimensions": self.embedding_dimensions,
+            "normalize": True
+        })[1:]
+        self.max_parallel_requests = max_parallel_requests
+        
+        # Documents written to Chroma per call, each call is one SQLite transaction
+        self.batch_size = batch_size
+        
+        # BM25 indexes built lazily per filter, dropped whenever documents change
+        self._bm25_indexes = {}
+        
+        # Incremented on every write so callers can invalidate derived caches
+        self.version = 0
         
         # Get the script's directory
         script_dir = Path(__file__).parent
@@ -36,8 +168,26 @@ class TranscriptVectorStore:
         self.transcripts_dir = self.data_dir / "transcripts"
         self.structured_dir = self.data_dir / "structured_transcripts"
         
+        # (mtime, size) per structured file already in the collection, files that match are not re-read
+        self.manifest_path = self.data_dir / ".manifest.json"
+        self.collection_name = collection_name
+        self._scanned_files = {}
+        
         # Create directories if they don't exist
         self._ensure_directories()
+        
+        # Content-addressed embedding cache: in-process LRU backed by SQLite on disk
+        self._embedding_model_key = f"{self.model_id}:{self.embedding_dimensions}"
+        self._embedding_memory_cache = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
+        self._embedding_cache_db = sqlite3.connect(
+            str(self.data_dir / "embedding_cache.sqlite3"),
+            check_same_thread=False
+        )
+        self._embedding_cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, key))"
+        )
 
     def _ensure_directories(self):
         """Create necessary directories if they don't exist"""
@@ -46,134 +196,346 @@ class TranscriptVectorStore:
                 directory.mkdir(parents=True)
                 logger.info(f"Created directory: {directory}")
 
-    def generate_embedding(self, text: str) -> List[float]:
+    def _get_cached_embedding(self, key: str) -> Optional[bytes]:
+        """Look up a float32 embedding by text hash, first in memory then on disk"""
+        with self._embedding_cache_lock:
+            vector = self._embedding_memory_cache.get(key)
+            if vector is not None:
+                self._embedding_memory_cache.move_to_end(key)
+                return vector
+            
+            row = self._embedding_cache_db.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND key = ?",
+                (self._embedding_model_key, key)
+            ).fetchone()
+            if row is None:
+                return None
+            self._remember_embedding(key, row[0])
+            return row[0]
+
+    def _put_cached_embedding(self, key: str, vector: bytes) -> None:
+        """Store a float32 embedding in memory and write it through to disk"""
+        with self._embedding_cache_lock:
+            self._remember_embedding(key, vector)
+            self._embedding_cache_db.execute(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)",
+                (self._embedding_model_key, key, vector)
+            )
+            self._embedding_cache_db.commit()
+
+    def _remember_embedding(self, key: str, vector: bytes) -> None:
+        """Add an embedding to the in-process LRU cache, evicting the oldest entry when full"""
+        self._embedding_memory_cache[key] = vector
+        self._embedding_memory_cache.move_to_end(key)
+        if len(self._embedding_memory_cache) > EMBEDDING_MEMORY_CACHE_SIZE:
+            self._embedding_memory_cache.popitem(last=False)
+
+    def generate_embedding(self, text: str) -> np.ndarray:
         """
-        Generate embeddings using Amazon Titan Text Embeddings V2
+        Generate a query embedding using Amazon Titan Text Embeddings V2 or Cohere Embed V3
+        
+        Embeddings are cached by SHA-256 of the text, so unchanged text is
+        only sent to Bedrock once per model and dimension setting.
         
         Args:
             text (str): Text to embed
             
         Returns:
-            List[float]: Embedding vector
+            np.ndarray: float32 embedding vector, empty if embedding failed
         """
         try:
+            key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            cached = self._get_cached_embedding(key)
+            if cached is not None:
+                return np.frombuffer(cached, dtype=np.float32)
+            
+            if self.is_cohere:
+                body = orjson.dumps({"texts": [text[:COHERE_MAX_CHARS]], "input_type": "search_query"})
+            else:
+                body = b'{"inputText":' + orjson.dumps(text) + self._titan_body_suffix
+            
             response = self.bedrock_client.invoke_model(
                 modelId=self.model_id,
                 contentType="application/json",
                 accept="application/json",
-                body=json.dumps({
-                    "inputText": text
-                })
+                body=body
             )
             
-            response_body = json.loads(response["body"].read())
-            return response_body["embedding"]
+            response_body = orjson.loads(response["body"].read())
+            if self.is_cohere:
+                embedding = np.asarray(response_body["embeddings"][0], dtype=np.float32)
+            else:
+                embedding = np.asarray(response_body["embedding"], dtype=np.float32)
+            self._put_cached_embedding(key, embedding.tobytes())
+            return embedding
             
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
-            return []
+            return np.empty(0, dtype=np.float32)
 
-    def load_structured_transcripts(self) -> Tuple[List[str], List[Dict], List[str], List[List[float]]]:
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed documents for storage with as few Bedrock requests as possible
+        
+        Cohere models take up to COHERE_BATCH_SIZE texts per request. Titan
+        only accepts one text per request, so those are sent concurrently.
+        
+        Args:
+            texts (List[str]): Documents to embed
+            
+        Returns:
+            np.ndarray: float32 array of shape (texts, dimensions), zero rows where embedding failed
+        """
+        embeddings = np.zeros((len(texts), self.embedding_dimensions), dtype=np.float32)
+        
+        if not self.is_cohere:
+            with ThreadPoolExecutor(max_workers=self.max_parallel_requests) as executor:
+                for row, embedding in enumerate(executor.map(self.generate_embedding, texts)):
+                    if embedding.size:
+                        embeddings[row] = embedding
+            return embeddings
+        
+        # Cohere document and query embeddings differ, so the input type is part of the key
+        keys = [hashlib.sha256(f"search_document:{text}".encode('utf-8')).hexdigest() for text in texts]
+        pending = []
+        for row, key in enumerate(keys):
+            cached = self._get_cached_embedding(key)
+            if cached is not None:
+                embeddings[row] = np.frombuffer(cached, dtype=np.float32)
+            else:
+                pending.append(row)
+        
+        for start in range(0, len(pending), COHERE_BATCH_SIZE):
+            rows = pending[start:start + COHERE_BATCH_SIZE]
+            try:
+                response = self.bedrock_client.invoke_model(
+                    modelId=self.model_id,
+                    contentType="application/json",
+                    accept="application/json",
+                    body=orjson.dumps({
+                        "texts": [texts[row][:COHERE_MAX_CHARS] for row in rows],
+                        "input_type": "search_document"
+                    })
+                )
+                vectors = np.asarray(orjson.loads(response["body"].read())["embeddings"], dtype=np.float32)
+            except Exception as e:
+                logger.error(f"Error generating batch embeddings: {str(e)}")
+                continue
+            
+            for row, vector in zip(rows, vectors):
+                embeddings[row] = vector
+                self._put_cached_embedding(keys[row], vector.tobytes())
+        
+        return embeddings
+
+    def _read_structured_file(self, file_path: Path) -> Optional[Dict]:
+        """
+        Read and parse a structured transcript file
+        
+        Small files are parsed with orjson. Larger files are streamed with
+        ijson and only the keys that become documents are kept in memory.
+        
+        Args:
+            file_path (Path): Structured transcript JSON file
+            
+        Returns:
+            Optional[Dict]: Parsed content if successful, None otherwise
+        """
+        try:
+            if file_path.stat().st_size < STREAMING_PARSE_THRESHOLD:
+                content = orjson.loads(file_path.read_bytes())
+                if not isinstance(content, dict):
+                    raise ValueError("expected a JSON object")
+                return content
+            
+            with open(file_path, 'rb') as f:
+                return {
+                    key: value
+                    for key, value in ijson.kvitems(f, "", use_float=True)
+                    if key in STRUCTURED_KEYS
+                }
+        except Exception as e:
+            logger.error(f"Error processing file {file_path}: {str(e)}")
+            return None
+
+    def load_structured_transcripts(self) -> Tuple[List[str], List[Dict], List[str], np.ndarray]:
         """
         Load structured transcript JSON files from structured_transcripts directory
         
+        Files whose modification time and size match the manifest are not
+        read at all, and documents already stored in the collection with the
+        same content are left out, so only new or changed documents are embedded.
+        
         Returns:
             Tuple containing:
                 - documents: List of text content
                 - metadatas: List of metadata dictionaries
                 - ids: List of document IDs
-                - embeddings: List of embedding vectors
+                - embeddings: float32 array of shape (documents, dimensions), zero rows where embedding failed
+        """
+        documents, metadatas, ids = self._load_documents()
+        
+        # Embed all documents into one contiguous matrix
+        embeddings = self._embed_batch(documents)
+        
+        return documents, metadatas, ids, embeddings
+
+    def _load_documents(self) -> Tuple[List[str], List[Dict], List[str]]:
+        """
+        Build documents, metadata and IDs from new or changed structured transcript files
+        
+        Stored documents that a changed file no longer produces are deleted.
+        
+        Returns:
+            Tuple[List[str], List[Dict], List[str]]: Documents, metadatas and IDs still to be embedded
         """
         documents = []
         metadatas = []
         ids = []
-        embeddings = []
         
-        # Add this to the load_structured_transcripts method
         logger.info(f"Looking for files in: {self.structured_dir}")
-        structured_files = list(self.structured_dir.glob('*.json'))
-        logger.info(f"Files found: {[str(f) for f in structured_files]}")
+        with os.scandir(self.structured_dir) as it:
+            entries = [entry for entry in it if entry.name.endswith('.json') and entry.is_file()]
         
-        if not structured_files:
+        if not entries:
             logger.warning("No structured transcript files found")
-            return documents, metadatas, ids, embeddings
+            return documents, metadatas, ids
+        
+        # Only read files that changed since they were last added to the collection
+        self._scanned_files = {}
+        for entry in entries:
+            stat = entry.stat()
+            self._scanned_files[entry.name] = [stat.st_mtime_ns, stat.st_size]
+        manifest = self._load_manifest()
+        structured_files = [
+            Path(entry.path) for entry in entries
+            if manifest.get(entry.name) != self._scanned_files[entry.name]
+        ]
         
-        logger.info(f"Found {len(structured_files)} structured transcript files")
+        logger.info(f"Found {len(entries)} structured transcript files, {len(structured_files)} new or changed")
+        if not structured_files:
+            return documents, metadatas, ids
+        
+        # Read and parse files concurrently, the work is dominated by file I/O
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            contents = list(executor.map(self._read_structured_file, structured_files))
         
-        # Process each structured file
-        for file_path in structured_files:
+        # Process each structured file, remembering the sources that were re-read
+        sources = []
+        for file_path, content in zip(structured_files, contents):
+            if content is None:
+                # Leave unreadable files out of the manifest so they are retried
+                self._scanned_files.pop(file_path.name, None)
+                continue
+            
+            # Build the file's documents apart so a malformed file adds none of them
+            file_documents, file_metadatas, file_ids = [], [], []
             try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    # Load the JSON data directly
-                    content = json.load(file)
-                    
-                    # Extract video ID from filename
-                    video_id = file_path.stem
-                    
-                    # Process introduction
-                    if "introduction" in content and content["introduction"]:
-                        intro_text = content["introduction"]
-                        doc_id = f"{video_id}_introduction"
-                        documents.append(intro_text)
-                        metadatas.append({
-                            "video_id": video_id,
-                            "type": "introduction",
-                            "source": f"{video_id}.json"
-                        })
-                        ids.append(doc_id)
-                        embeddings.append(self.generate_embedding(intro_text))
-                    
-                    # Process conversation
-                    if "conversation" in content and content["conversation"]:
-                        conv_text = content["conversation"]
-                        doc_id = f"{video_id}_conversation"
-                        documents.append(conv_text)
-                        metadatas.append({
-                            "video_id": video_id,
-                            "type": "conversation",
-                            "source": f"{video_id}.json"
-                        })
-                        ids.append(doc_id)
-                        embeddings.append(self.generate_embedding(conv_text))
+                # Extract video ID from filename, interned since every row of the file shares it
+                video_id = sys.intern(file_path.stem)
+            
+                # Metadata shared by every document of this file
+                base_metadata = {"video_id": video_id, "source": sys.intern(f"{video_id}.json")}
+            
+                # Process introduction and conversation, split into chunks
+                for section in ("introduction", "conversation"):
+                    if text := content.get(section):
+                        for i, chunk in enumerate(chunk_text(text)):
+                            # The first chunk keeps the unsuffixed ID used before chunking
+                            doc_id = f"{video_id}_{section}" if i == 0 else f"{video_id}_{section}_{i}"
+                            file_documents.append(chunk)
+                            file_metadatas.append({
+                                **base_metadata,
+                                "type": section,
+                                "chunk": i,
+                                "line_count": chunk.count('\n') + 1
+                            })
+                            file_ids.append(doc_id)
+            
+                # Process Q&A pairs
+                if qa_pairs := content.get("qa_pairs"):
+                    for i, qa_pair in enumerate(qa_pairs, 1):
+                        # Process question
+                        if q_text := qa_pair.get("question"):
+                            q_id = f"{video_id}_question_{i}"
+                            file_documents.append(q_text)
+                            file_metadatas.append({
+                                **base_metadata,
+                                "type": "question",
+                                "question_number": i,
+                                "line_count": q_text.count('\n') + 1
+                            })
+                            file_ids.append(q_id)
                     
-                    # Process Q&A pairs
-                    if "qa_pairs" in content and content["qa_pairs"]:
-                        for i, qa_pair in enumerate(content["qa_pairs"], 1):
-                            # Process question
-                            if "question" in qa_pair and qa_pair["question"]:
-                                q_text = qa_pair["question"]
-                                q_id = f"{video_id}_question_{i}"
-                                documents.append(q_text)
-                                metadatas.append({
-                                    "video_id": video_id,
-                                    "type": "question",
-                                    "question_number": i,
-                                    "source": f"{video_id}.json"
-                                })
-                                ids.append(q_id)
-                                embeddings.append(self.generate_embedding(q_text))
-                            
-                            # Process answer
-                            if "answer" in qa_pair and qa_pair["answer"]:
-                                a_text = qa_pair["answer"]
-                                a_id = f"{video_id}_answer_{i}"
-                                documents.append(a_text)
-                                metadatas.append({
-                                    "video_id": video_id,
-                                    "type": "answer",
-                                    "question_number": i,
-                                    "source": f"{video_id}.json"
-                                })
-                                ids.append(a_id)
-                                embeddings.append(self.generate_embedding(a_text))
-                
+                        # Process answer
+                        if a_text := qa_pair.get("answer"):
+                            a_id = f"{video_id}_answer_{i}"
+                            file_documents.append(a_text)
+                            file_metadatas.append({
+                                **base_metadata,
+                                "type": "answer",
+                                "question_number": i,
+                                "line_count": a_text.count('\n') + 1
+                            })
+                            file_ids.append(a_id)
             except Exception as e:
                 logger.error(f"Error processing file {file_path}: {str(e)}")
+                self._scanned_files.pop(file_path.name, None)
+                continue
+            
+            documents.extend(file_documents)
+            metadatas.extend(file_metadatas)
+            ids.extend(file_ids)
+            sources.append(base_metadata["source"])
         
-        return documents, metadatas, ids, embeddings
+        # Sections that got shorter or Q&A pairs that were removed leave documents behind
+        self._delete_stale_documents(sources, set(ids))
+        
+        # Skip documents that are already stored unchanged, the rest carry their content hash
+        if ids:
+            existing = self.collection.get(ids=ids, include=["metadatas"])
+            existing_hashes = {
+                doc_id: (metadata or {}).get("content_hash")
+                for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+            }
+            content_hashes = [self._content_hash(doc, metadata) for doc, metadata in zip(documents, metadatas)]
+            changed = [
+                existing_hashes.get(doc_id) != content_hash
+                for doc_id, content_hash in zip(ids, content_hashes)
+            ]
+            logger.info(f"{len(ids) - sum(changed)} documents unchanged, {sum(changed)} to embed")
+            documents = list(compress(documents, changed))
+            metadatas = [
+                {**metadata, "content_hash": content_hash}
+                for metadata, content_hash in compress(zip(metadatas, content_hashes), changed)
+            ]
+            ids = list(compress(ids, changed))
+        
+        return documents, metadatas, ids
+
+    def _delete_stale_documents(self, sources: List[str], current_ids: Set[str]) -> None:
+        """
+        Delete stored documents of re-read files that the files no longer produce
+        
+        Args:
+            sources (List[str]): Source file names that were re-read
+            current_ids (Set[str]): Document IDs built from those files
+        """
+        if not sources:
+            return
+        try:
+            stored = self.collection.get(where={"source": {"$in": sources}}, include=[])
+            stale = [doc_id for doc_id in stored["ids"] if doc_id not in current_ids]
+            if stale:
+                self.collection.delete(ids=stale)
+                self._bm25_indexes.clear()
+                self.version += 1
+                logger.info(f"Deleted {len(stale)} documents no longer in their transcript files")
+        except Exception as e:
+            logger.error(f"Error deleting stale documents: {str(e)}")
 
     def add_to_vector_store(self, documents: List[str], metadatas: List[Dict], 
-                           ids: List[str], embeddings: List[List[float]]) -> bool:
+                           ids: List[str], embeddings: np.ndarray) -> bool:
         """
         Add documents to the vector store
         
@@ -181,41 +543,93 @@ class TranscriptVectorStore:
             documents (List[str]): List of document texts
             metadatas (List[Dict]): List of metadata dictionaries
             ids (List[str]): List of document IDs
-            embeddings (List[List[float]]): List of embedding vectors
+            embeddings (np.ndarray): Embedding vectors, one row per document
             
         Returns:
             bool: True if successful, False otherwise
         """
-        # Filter out documents with empty embeddings
-        valid_docs = []
-        valid_metadatas = []
-        valid_ids = []
-        valid_embeddings = []
-        
-        for doc, metadata, doc_id, embedding in zip(documents, metadatas, ids, embeddings):
-            if embedding and len(embedding) > 0:
-                valid_docs.append(doc)
-                valid_metadatas.append(metadata)
-                valid_ids.append(doc_id)
-                valid_embeddings.append(embedding)
+        # Filter out documents whose embedding failed (all-zero rows)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        valid = np.any(embeddings, axis=1)
+        valid_docs = list(compress(documents, valid))
+        valid_metadatas = list(compress(metadatas, valid))
+        valid_ids = list(compress(ids, valid))
+        valid_embeddings = embeddings[valid]
         
         if not valid_docs:
             logger.warning("No valid documents with embeddings to add to vector store")
             return False
         
         try:
-            self.collection.add(
-                documents=valid_docs,
-                metadatas=valid_metadatas,
-                ids=valid_ids,
-                embeddings=valid_embeddings
-            )
-            logger.info(f"Added {len(valid_docs)} documents to the vector store")
+            # Only write documents that are new or whose content changed
+            existing = self.collection.get(ids=valid_ids, include=["metadatas"])
+            existing_hashes = {
+                doc_id: (metadata or {}).get("content_hash")
+                for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+            }
+            
+            content_hashes = [self._content_hash(doc, metadata) for doc, metadata in zip(valid_docs, valid_metadatas)]
+            changed = np.array([
+                existing_hashes.get(doc_id) != content_hash
+                for doc_id, content_hash in zip(valid_ids, content_hashes)
+            ], dtype=bool)
+            
+            new_docs = list(compress(valid_docs, changed))
+            new_metadatas = [
+                {**metadata, "content_hash": content_hash}
+                for metadata, content_hash in compress(zip(valid_metadatas, content_hashes), changed)
+            ]
+            new_ids = list(compress(valid_ids, changed))
+            new_embeddings = valid_embeddings[changed]
+        except Exception as e:
+            logger.error(f"Error adding documents to vector store: {str(e)}")
+            return False
+        
+        if not new_docs:
+            logger.info("Vector store is already up to date")
+            return True
+        return self._upsert_documents(new_docs, new_metadatas, new_ids, new_embeddings)
+
+    def _upsert_documents(self, documents: List[str], metadatas: List[Dict],
+                          ids: List[str], embeddings: np.ndarray) -> bool:
+        """
+        Write documents known to be new or changed, without comparing content hashes again
+        
+        Args:
+            documents (List[str]): Document texts
+            metadatas (List[Dict]): Metadata per document, including its content hash
+            ids (List[str]): Document IDs
+            embeddings (np.ndarray): Embedding vectors, one non-zero row per document
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            # Write in fixed-size batches to amortize per-call overhead
+            for start in range(0, len(documents), self.batch_size):
+                end = start + self.batch_size
+                self.collection.upsert(
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end]
+                )
+            self._bm25_indexes.clear()
+            self.version += 1
+            logger.info(f"Added {len(documents)} documents to the vector store")
             return True
         except Exception as e:
             logger.error(f"Error adding documents to vector store: {str(e)}")
             return False
 
+    @staticmethod
+    def _content_hash(document: str, metadata: Dict) -> str:
+        """Hash a document and its metadata to detect changed content"""
+        if "content_hash" in metadata:
+            metadata = {key: value for key, value in metadata.items() if key != "content_hash"}
+        payload = document + json.dumps(metadata, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
     def query_similar(self, query_text: str, n_results: int = 3, 
                      filter_criteria: Optional[Dict] = None) -> Dict:
         """
@@ -233,14 +647,10 @@ class TranscriptVectorStore:
             # Generate embedding for the query
             query_embedding = self.generate_embedding(query_text)
             
-            # Log detailed embedding information
-            logger.info(f"Query: {query_text}")
-            logger.info(f"Query Embedding Length: {len(query_embedding)}")
-            logger.info(f"Query Embedding (first 5 values): {query_embedding[:5]}")
-            
-            # Check if the collection is empty
-            collection_count = self.collection.count()
-            logger.info(f"Total documents in collection: {collection_count}")
+            # Log detailed embedding information, formatted only when debug logging is on
+            logger.debug("Query: %s", query_text)
+            logger.debug("Query Embedding Length: %d", len(query_embedding))
+            logger.debug("Query Embedding (first 5 values): %s", query_embedding[:5])
             
             # Query the collection
             results = self.collection.query(
@@ -254,6 +664,134 @@ class TranscriptVectorStore:
             logger.error(f"Error querying vector store: {str(e)}")
             return {"ids": [], "documents": [], "metadatas": [], "distances": []}
 
+    def _get_bm25_index(self, filter_criteria: Optional[Dict] = None) -> Tuple[Optional[BM25Okapi], Dict]:
+        """
+        Get the BM25 index over documents matching a filter, building it on first use
+        
+        Args:
+            filter_criteria (Optional[Dict]): Filter criteria for the indexed documents
+            
+        Returns:
+            Tuple of the BM25 index (None if no documents match) and the indexed documents
+        """
+        key = json.dumps(filter_criteria, sort_keys=True)
+        if key not in self._bm25_indexes:
+            corpus = self.collection.get(where=filter_criteria, include=["documents", "metadatas"])
+            index = None
+            if corpus["ids"]:
+                index = BM25Okapi([tokenize(doc) for doc in corpus["documents"]], k1=1.2, b=0.75)
+            self._bm25_indexes[key] = (index, corpus)
+        return self._bm25_indexes[key]
+
+    def hybrid_query(self, query_text: str, n_results: int = 3,
+                     filter_criteria: Optional[Dict] = None) -> Dict:
+        """
+        Query the vector store combining vector similarity with BM25 keyword scores
+        
+        Both retrievers return their top candidates, scores are min-max normalized
+        and merged by weighted sum.
+        
+        Args:
+            query_text (str): Query text
+            n_results (int): Number of results to return
+            filter_criteria (Optional[Dict]): Filter criteria for the query
+            
+        Returns:
+            Dict: Query results in Chroma's format, distances are 1 - hybrid score
+        """
+        try:
+            documents = {}
+            metadatas = {}
+            
+            # Vector candidates, higher is better
+            vector_results = self.query_similar(query_text, HYBRID_CANDIDATES, filter_criteria)
+            vector_scores = {}
+            if vector_results["ids"]:
+                for doc_id, doc, metadata, distance in zip(vector_results["ids"][0],
+                                                           vector_results["documents"][0],
+                                                           vector_results["metadatas"][0],
+                                                           vector_results["distances"][0]):
+                    vector_scores[doc_id] = -distance
+                    documents[doc_id] = doc
+                    metadatas[doc_id] = metadata
+            
+            # Keyword candidates, documents sharing no term with the query are skipped
+            bm25_scores = {}
+            index, corpus = self._get_bm25_index(filter_criteria)
+            if index is not None:
+                scores = index.get_scores(tokenize(query_text))
+                top = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:HYBRID_CANDIDATES]
+                for i in top:
+                    if scores[i] <= 0:
+                        break
+                    doc_id = corpus["ids"][i]
+                    bm25_scores[doc_id] = float(scores[i])
+                    documents[doc_id] = corpus["documents"][i]
+                    metadatas[doc_id] = corpus["metadatas"][i]
+            
+            # Merge normalized scores, candidates missing from one retriever score 0 there
+            vector_scores = _min_max(vector_scores)
+            bm25_scores = _min_max(bm25_scores)
+            combined = {
+                doc_id: HYBRID_VECTOR_WEIGHT * vector_scores.get(doc_id, 0.0)
+                        + (1 - HYBRID_VECTOR_WEIGHT) * bm25_scores.get(doc_id, 0.0)
+                for doc_id in documents
+            }
+            ranked = sorted(combined, key=combined.get, reverse=True)[:n_results]
+            
+            return {
+                "ids": [ranked],
+                "documents": [[documents[doc_id] for doc_id in ranked]],
+                "metadatas": [[metadatas[doc_id] for doc_id in ranked]],
+                "distances": [[1 - combined[doc_id] for doc_id in ranked]]
+            }
+        except Exception as e:
+            logger.error(f"Error running hybrid query: {str(e)}")
+            return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+    def get_cached_question(self, key_embedding: np.ndarray,
+                            threshold: float = CACHE_SIMILARITY_THRESHOLD) -> Optional[Dict]:
+        """
+        Look up a previously generated question for a similar prompt
+        
+        Args:
+            key_embedding (np.ndarray): Embedding of the cache key
+            threshold (float): Minimum cosine similarity for a hit
+            
+        Returns:
+            Optional[Dict]: Cached question data on a hit, None otherwise
+        """
+        try:
+            results = self.question_cache.query(
+                query_embeddings=[key_embedding],
+                n_results=1,
+                include=["metadatas", "distances"]
+            )
+            if results["ids"] and results["ids"][0] and results["distances"][0][0] <= 1 - threshold:
+                return json.loads(results["metadatas"][0][0]["json"])
+        except Exception as e:
+            logger.error(f"Error reading question cache: {str(e)}")
+        return None
+
+    def cache_question(self, key: str, key_embedding: np.ndarray, question_data: Dict) -> None:
+        """
+        Store a generated question in the semantic cache
+        
+        Args:
+            key (str): Cache key the question was generated for
+            key_embedding (np.ndarray): Embedding of the cache key
+            question_data (Dict): Generated question data
+        """
+        try:
+            self.question_cache.upsert(
+                documents=[key],
+                metadatas=[{"json": json.dumps(question_data, ensure_ascii=False)}],
+                ids=[hashlib.sha1(key.encode('utf-8')).hexdigest()],
+                embeddings=[key_embedding]
+            )
+        except Exception as e:
+            logger.error(f"Error writing question cache: {str(e)}")
+
     def process_all_transcripts(self) -> bool:
         """
         Process all structured transcripts and add to vector store
@@ -262,13 +800,94 @@ class TranscriptVectorStore:
             bool: True if successful, False otherwise
         """
         # Load structured transcripts
-        documents, metadatas, ids, embeddings = self.load_structured_transcripts()
+        documents, metadatas, ids = self._load_documents()
         
-        # Add to vector store
+        # Embed and add to vector store
+        failed = set()
+        success = True
         if documents:
-            return self.add_to_vector_store(documents, metadatas, ids, embeddings)
-        else:
-            return False
+            success, failed = self._embed_and_store(documents, metadatas, ids)
+        
+        # Nothing stored is fine as long as transcripts were loaded before
+        success = success and self.collection.count() > 0
+        
+        if success:
+            # Files with a document that failed to embed stay out of the manifest so they are retried
+            self._save_manifest({
+                name: signature for name, signature in self._scanned_files.items()
+                if name not in failed
+            })
+        return success
+
+    def _embed_and_store(self, documents: List[str], metadatas: List[Dict],
+                         ids: List[str]) -> Tuple[bool, Set[str]]:
+        """
+        Embed documents batch by batch while a writer thread adds finished batches to Chroma
+        
+        Only a few batches of embeddings are held in memory at a time, and
+        Bedrock requests for the next batch overlap with the SQLite writes of
+        the previous one. Chroma writes stay on a single thread.
+        
+        Args:
+            documents (List[str]): New or changed document texts, as returned by _load_documents
+            metadatas (List[Dict]): Metadata per document, including its content hash
+            ids (List[str]): Document IDs
+            
+        Returns:
+            Tuple[bool, Set[str]]: Whether every write succeeded, and the source files with a document that failed to embed
+        """
+        batches = queue.Queue(maxsize=4)
+        write_errors = []
+        
+        def write_batches():
+            while (batch := batches.get()) is not None:
+                if not self._upsert_documents(*batch):
+                    write_errors.append(batch[2])
+        
+        writer = threading.Thread(target=write_batches, daemon=True)
+        writer.start()
+        
+        failed = set()
+        try:
+            for start in range(0, len(documents), self.batch_size):
+                end = start + self.batch_size
+                embeddings = self._embed_batch(documents[start:end])
+                embedded = np.any(embeddings, axis=1)
+                failed.update(
+                    metadata["source"] for metadata in compress(metadatas[start:end], ~embedded)
+                )
+                # _load_documents already dropped unchanged documents, so only failed embeddings are left out
+                if embedded.any():
+                    batches.put((
+                        list(compress(documents[start:end], embedded)),
+                        list(compress(metadatas[start:end], embedded)),
+                        list(compress(ids[start:end], embedded)),
+                        embeddings[embedded]
+                    ))
+        finally:
+            batches.put(None)
+            writer.join()
+        
+        return not write_errors, failed
+
+    def _load_manifest(self) -> Dict[str, List[int]]:
+        """Load the file manifest of this collection, empty if the collection has no documents"""
+        try:
+            if self.collection.count() == 0 or not self.manifest_path.exists():
+                return {}
+            return orjson.loads(self.manifest_path.read_bytes()).get(self.collection_name, {})
+        except Exception as e:
+            logger.error(f"Error loading manifest: {str(e)}")
+            return {}
+
+    def _save_manifest(self, files: Dict[str, List[int]]) -> None:
+        """Record the (mtime, size) of every structured file now stored in this collection"""
+        try:
+            manifest = orjson.loads(self.manifest_path.read_bytes()) if self.manifest_path.exists() else {}
+            manifest[self.collection_name] = files
+            self.manifest_path.write_bytes(orjson.dumps(manifest))
+        except Exception as e:
+            logger.error(f"Error saving manifest: {str(e)}")
 
     def migrate_existing_files(self) -> None:
         """
@@ -335,6 +954,7 @@ def main():
     parser.add_argument('--query', '-q', help='Query the vector store')
     parser.add_argument('--filter', '-f', help='Filter criteria (JSON string)')
     parser.add_argument('--results', '-r', type=int, default=3, help='Number of results to return')
+    parser.add_argument('--hybrid', action='store_true', help='Combine vector search with BM25 keyword scores')
     parser.add_argument('--migrate', '-m', action='store_true', help='Migrate existing files to new folder structure')
     args = parser.parse_args()
     
@@ -349,7 +969,10 @@ def main():
     if args.query:
         # Query the vector store
         filter_criteria = json.loads(args.filter) if args.filter else None
-        results = vector_store.query_similar(args.query, args.results, filter_criteria)
+        if args.hybrid:
+            results = vector_store.hybrid_query(args.query, args.results, filter_criteria)
+        else:
+            results = vector_store.query_similar(args.query, args.results, filter_criteria)
         
         print("\nQuery Results:")
         for i, (doc_id, doc, metadata, distance) in enumerate(zip(
@@ -1,10 +1,23 @@
 import os
 import json
-import boto3
+from botocore.exceptions import ClientError
+import hashlib
+import orjson
 import logging
-from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
 import re
 
+# Works both when run as a script from backend/ and when imported as backend.structured_data
+try:
+    from . import batch, bedrock
+    from .json_scanner import JsonObjectScanner, extract_json_span
+except ImportError:
+    import batch
+    import bedrock
+    from json_scanner import JsonObjectScanner, extract_json_span
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,21 +25,66 @@ logger = logging.getLogger(__name__)
 # Model ID
 MODEL_ID = "amazon.nova-micro-v1:0"
 
+# Structuring prompt split around the transcript, so building it is two concatenations.
+# Kept unindented, leading whitespace would only add input tokens.
+_PROMPT_PREFIX = """You are an expert Spanish language teacher. I have a transcript from a Spanish A1 level listening comprehension video.
+Please analyze this transcript and structure it into a JSON format with the following structure:
+
+{
+    "introduction": "Introduction text here",
+    "conversation": "Conversation text here",
+    "qa_pairs": [
+        {
+            "question": "Question 1 text here",
+            "answer": "Answer 1 text here"
+        },
+        {
+            "question": "Question 2 text here",
+            "answer": "Answer 2 text here"
+        },
+        ...
+    ]
+}
+
+Here is the transcript:
+
+"""
+_PROMPT_SUFFIX = """
+
+Return only the JSON object with no additional text or explanation.
+"""
+
+# Fingerprint of the prompt template, part of the response cache key so editing the prompt invalidates cached responses
+_PROMPT_VERSION = hashlib.blake2b((_PROMPT_PREFIX + _PROMPT_SUFFIX).encode('utf-8'), digest_size=8).digest()
+
+# Section headers of transcripts that already follow the "Introducción: ... Pregunta 1: ... Respuesta 1: ..." layout
+_SECTION_RE = re.compile(
+    r'(introducci[oó]n|conversaci[oó]n|pregunta\s+\d+|respuesta\s+\d+)\s*:',
+    re.IGNORECASE
+)
+
+# Concurrent Bedrock requests when processing all transcripts, keep within the account's RPM/TPM quota
+MAX_WORKERS = int(os.environ.get("STRUCTURER_MAX_WORKERS", "16"))
+
 class TranscriptStructurer:
     def __init__(self, model_id: str = MODEL_ID):
         """Initialize Bedrock client for transcript structuring"""
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name="us-east-1")
+        self.bedrock_client = bedrock.client
         self.model_id = model_id
         
-        # Update paths to use the new folder structure
-        self.data_dir = "./data"
-        self.transcripts_dir = os.path.join(self.data_dir, "transcripts")
-        self.structured_dir = os.path.join(self.data_dir, "structured_transcripts")
+        # Directory paths, resolved once relative to the script like TranscriptVectorStore
+        self.data_dir = (Path(__file__).parent / "data").resolve()
+        self.transcripts_dir = self.data_dir / "transcripts"
+        self.structured_dir = self.data_dir / "structured_transcripts"
+        # Raw model responses keyed by model and transcript, so identical transcripts are only sent once
+        self.llm_cache_dir = self.data_dir / "llm_cache"
+        # Parsed results by the same key, for repeats within one process
+        self._structured_cache = {}
         
         # Create directories if they don't exist
-        for directory in [self.data_dir, self.transcripts_dir, self.structured_dir]:
-            if not os.path.exists(directory):
-                os.makedirs(directory)
+        for directory in [self.data_dir, self.transcripts_dir, self.structured_dir, self.llm_cache_dir]:
+            if not directory.exists():
+                directory.mkdir(parents=True)
                 logger.info(f"Created directory: {directory}")
 
     def load_transcript(self, filename: str) -> Optional[str]:
@@ -39,93 +97,193 @@ class TranscriptStructurer:
         Returns:
             Optional[str]: Transcript text if successful, None otherwise
         """
-        filepath = os.path.join(self.transcripts_dir, filename)
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
+            return (self.transcripts_dir / filename).read_bytes().decode('utf-8')
         except Exception as e:
             logger.error(f"Error loading transcript: {str(e)}")
             return None
 
-    def list_transcripts(self) -> List[str]:
+    def list_transcripts(self, skip_processed: bool = False) -> List[str]:
         """
         List all transcript files in the transcripts directory
         
+        Args:
+            skip_processed (bool): Leave out transcripts that already have a structured file
+            
         Returns:
             List[str]: List of transcript filenames
         """
         try:
-            return [f for f in os.listdir(self.transcripts_dir) if f.endswith('.txt')]
+            processed = set()
+            if skip_processed:
+                with os.scandir(self.structured_dir) as it:
+                    processed = {entry.name[:-len('.json')] for entry in it if entry.name.endswith('.json')}
+            
+            with os.scandir(self.transcripts_dir) as it:
+                return [
+                    entry.name for entry in it
+                    if entry.name.endswith('.txt') and entry.name[:-len('.txt')] not in processed
+                ]
         except Exception as e:
             logger.error(f"Error listing transcripts: {str(e)}")
             return []
 
+    def extract_sections(self, transcript_text: str) -> Optional[Dict]:
+        """
+        Structure a transcript that already has explicit section headers, without calling the model
+        
+        Args:
+            transcript_text (str): Raw transcript text
+            
+        Returns:
+            Optional[Dict]: Structured transcript if every section was found exactly once, None otherwise
+        """
+        parts = _SECTION_RE.split(transcript_text)
+        if len(parts) < 3:
+            return None
+        
+        sections = {}
+        questions = {}
+        answers = {}
+        for header, body in zip(parts[1::2], parts[2::2]):
+            header = header.lower()
+            body = body.strip()
+            if not body:
+                return None
+            if header.startswith("introducci"):
+                target, key = sections, "introduction"
+            elif header.startswith("conversaci"):
+                target, key = sections, "conversation"
+            elif header.startswith("pregunta"):
+                target, key = questions, int(header.split()[-1])
+            else:
+                target, key = answers, int(header.split()[-1])
+            # A repeated header is more likely a word in the text than a section, leave it to the model
+            if key in target:
+                return None
+            target[key] = body
+        
+        # Every question needs its answer, otherwise leave it to the model
+        if len(sections) < 2 or not questions or questions.keys() != answers.keys():
+            return None
+        
+        sections["qa_pairs"] = [
+            {"question": questions[number], "answer": answers[number]}
+            for number in sorted(questions)
+        ]
+        return sections
+
     def structure_transcript(self, transcript_text: str) -> Optional[Dict]:
         """
         Structure transcript into Introduction, Conversation, and Questions
         
+        Transcripts with explicit section headers are split directly. Other
+        results are cached in memory and on disk by hash of transcript, model
+        ID and prompt template, a repeated transcript is never sent to Bedrock twice.
+        
         Args:
             transcript_text (str): Raw transcript text
             
         Returns:
             Optional[Dict]: Structured transcript if successful, None otherwise
         """
-        prompt = f"""
-        You are an expert Spanish language teacher. I have a transcript from a Spanish A1 level listening comprehension video.
-        Please analyze this transcript and structure it into a JSON format with the following structure:
-
-        {{
-            "introduction": "Introduction text here",
-            "conversation": "Conversation text here",
-            "qa_pairs": [
-                {{
-                    "question": "Question 1 text here",
-                    "answer": "Answer 1 text here"
-                }},
-                {{
-                    "question": "Question 2 text here",
-                    "answer": "Answer 2 text here"
-                }},
-                ...
-            ]
-        }}
+        structured_data = self.extract_sections(transcript_text)
+        if structured_data is not None:
+            logger.info("Transcript already has section headers, skipping the model")
+            return structured_data
         
-        Here is the transcript:
+        cache_key = self._cache_key(transcript_text)
+        structured_data = self._structured_cache.get(cache_key)
+        if structured_data is not None:
+            return structured_data
+        cache_path = self._cache_path(cache_key)
         
-        {transcript_text}
+        try:
+            if cache_path.exists():
+                raw_text = cache_path.read_bytes().decode('utf-8')
+            else:
+                prompt = self.build_prompt(transcript_text)
+                response = self.bedrock_client.converse_stream(
+                    modelId=self.model_id,
+                    messages=[{
+                        "role": "user",
+                        "content": [{"text": prompt}]
+                    }],
+                    inferenceConfig={"temperature": 0.2}
+                )
+                
+                # Collect the streamed text, stopping as soon as the JSON object is complete
+                chunks = []
+                scanner = JsonObjectScanner()
+                stream = response["stream"]
+                for event in stream:
+                    if "contentBlockDelta" not in event:
+                        continue
+                    text = event["contentBlockDelta"]["delta"].get("text", "")
+                    chunks.append(text)
+                    if scanner.feed(text):
+                        stream.close()
+                        break
+                raw_text = "".join(chunks)
+            
+            structured_data = self.parse_response(raw_text, cache_path)
+            if structured_data is not None:
+                self._structured_cache[cache_key] = structured_data
+            return structured_data
+                
+        except Exception as e:
+            logger.error(f"Error structuring transcript: {str(e)}")
+            return None
+
+    def build_prompt(self, transcript_text: str) -> str:
+        """
+        Build the structuring prompt for a transcript
         
-        Return only the JSON object with no additional text or explanation.
+        Args:
+            transcript_text (str): Raw transcript text
+            
+        Returns:
+            str: Prompt asking the model for the structured JSON
         """
+        return _PROMPT_PREFIX + transcript_text + _PROMPT_SUFFIX
+
+    def _cache_key(self, transcript_text: str) -> str:
+        """Content hash identifying the model response for a transcript, model and prompt template"""
+        return hashlib.blake2b(
+            transcript_text.encode('utf-8') + self.model_id.encode('utf-8') + _PROMPT_VERSION,
+            digest_size=16
+        ).hexdigest()
 
+    def _cache_path(self, cache_key: str) -> Path:
+        """Path of the cached model response for a cache key"""
+        return self.llm_cache_dir / f"{cache_key}.json"
+
+    def parse_response(self, raw_text: str, cache_path: Optional[Path] = None) -> Optional[Dict]:
+        """
+        Parse the structured transcript out of a model response
+        
+        Args:
+            raw_text (str): Model response text
+            cache_path (Optional[Path]): Where to cache the response once it parsed
+            
+        Returns:
+            Optional[Dict]: Structured transcript if the response parsed, None otherwise
+        """
+        # Try to parse the JSON object in the response, ignoring fences and surrounding text
         try:
-            response = self.bedrock_client.converse(
-                modelId=self.model_id,
-                messages=[{
-                    "role": "user",
-                    "content": [{"text": prompt}]
-                }],
-                inferenceConfig={"temperature": 0.2}
-            )
-            
-            response_text = response['output']['message']['content'][0]['text']
-            
-            # Try to parse the response as JSON
-            try:
-                # Remove any markdown code block formatting if present
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].split("```")[0].strip()
-                    
-                structured_data = json.loads(response_text)
-                return structured_data
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing JSON response: {str(e)}")
-                logger.error(f"Response text: {response_text}")
-                return None
+            start, end = extract_json_span(raw_text)
+            if start == -1:
+                raise ValueError("no complete JSON object in response")
                 
-        except Exception as e:
-            logger.error(f"Error structuring transcript: {str(e)}")
+            structured_data = orjson.loads(raw_text[start:end])
+            
+            # Only cache responses that parsed, so a bad answer is retried next time
+            if cache_path is not None and not cache_path.exists():
+                cache_path.write_bytes(raw_text.encode('utf-8'))
+            return structured_data
+        except ValueError as e:
+            logger.error(f"Error parsing JSON response: {str(e)}")
+            logger.error(f"Response text: {raw_text}")
             return None
 
     def save_structured_data(self, filename: str, structured_data: Dict) -> bool:
@@ -140,15 +298,14 @@ class TranscriptStructurer:
             bool: True if successful, False otherwise
         """
         # Extract video ID from filename (remove .txt extension)
-        video_id = os.path.splitext(os.path.basename(filename))[0]
+        video_id = Path(filename).stem
         
         # Create output filename without the _structured suffix
         output_filename = f"{video_id}.json"
-        output_path = os.path.join(self.structured_dir, output_filename)
+        output_path = self.structured_dir / output_filename
         
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(structured_data, f, indent=2, ensure_ascii=False)
+            output_path.write_bytes(orjson.dumps(structured_data, option=orjson.OPT_INDENT_2))
             logger.info(f"Structured data saved to {output_path}")
             return True
         except Exception as e:
@@ -180,6 +337,112 @@ class TranscriptStructurer:
         
         return structured_data
 
+    def process_all_transcripts(self, max_workers: int = MAX_WORKERS, force: bool = False,
+                                on_result: Optional[Callable[[str, Optional[Dict]], None]] = None,
+                                filenames: Optional[List[str]] = None) -> Dict[str, Optional[Dict]]:
+        """
+        Process all transcript files concurrently
+        
+        Each transcript is an independent Bedrock round-trip, so they are run
+        on a thread pool instead of one after another.
+        
+        Args:
+            max_workers (int): Maximum number of concurrent Bedrock requests
+            force (bool): Also reprocess transcripts that already have a structured file
+            on_result (Optional[Callable]): Called with filename and result as each transcript finishes
+            filenames (Optional[List[str]]): Transcript filenames, defaults to all unprocessed transcripts
+            
+        Returns:
+            Dict[str, Optional[Dict]]: Structured transcript per filename, None where processing failed
+        """
+        if filenames is None:
+            filenames = self.list_transcripts(skip_processed=not force)
+        if not filenames:
+            return {}
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.process_transcript, filename): filename for filename in filenames}
+            for future in as_completed(futures):
+                filename = futures[future]
+                results[filename] = future.result()
+                if on_result:
+                    on_result(filename, results[filename])
+        return results
+
+    def process_all_batch(self, filenames: Optional[List[str]] = None,
+                          poll_interval: int = 60, force: bool = False) -> Dict[str, Optional[Dict]]:
+        """
+        Process transcripts offline with a single Bedrock batch inference job
+        
+        Transcripts with section headers or a cached response are handled
+        locally, the rest are submitted as one job and saved once it finishes.
+        Requires the batch S3 bucket and role to be configured, see batch.py.
+        Too few transcripts for a batch job are processed online instead.
+        
+        Args:
+            filenames (Optional[List[str]]): Transcript filenames, defaults to all unprocessed transcripts
+            poll_interval (int): Seconds between job status checks
+            force (bool): With the default filenames, also reprocess transcripts that already have a structured file
+            
+        Returns:
+            Dict[str, Optional[Dict]]: Structured transcript per filename, None where processing failed
+        """
+        if filenames is None:
+            filenames = self.list_transcripts(skip_processed=not force)
+        
+        results = {}
+        prompts = {}
+        cache_paths = {}
+        for filename in filenames:
+            transcript_text = self.load_transcript(filename)
+            if not transcript_text:
+                results[filename] = None
+                continue
+            
+            structured_data = self.extract_sections(transcript_text)
+            if structured_data is None:
+                cache_paths[filename] = self._cache_path(self._cache_key(transcript_text))
+                if not cache_paths[filename].exists():
+                    prompts[filename] = self.build_prompt(transcript_text)
+                    continue
+                structured_data = self.parse_response(cache_paths[filename].read_bytes().decode('utf-8'))
+            
+            if structured_data:
+                self.save_structured_data(filename, structured_data)
+            results[filename] = structured_data
+        
+        if not prompts:
+            return results
+        
+        if len(prompts) < batch.BATCH_MIN_RECORDS:
+            logger.warning(f"{len(prompts)} transcripts is below the batch minimum of "
+                           f"{batch.BATCH_MIN_RECORDS} records, processing them online")
+            results.update(self.process_all_transcripts(filenames=list(prompts)))
+            return results
+        
+        # Bedrock record IDs are 11 character alphanumeric strings, so map them back to filenames
+        record_ids = {batch.record_id(i): filename for i, filename in enumerate(prompts)}
+        job_arn = batch.submit(
+            list(prompts.values()),
+            record_ids=list(record_ids),
+            model_id=self.model_id,
+            inference_config={"temperature": 0.2}
+        )
+        status = batch.wait(job_arn, poll_interval=poll_interval)
+        responses = batch.read_results(job_arn) if status in ("Completed", "PartiallyCompleted") else {}
+        if not responses:
+            logger.error(f"Batch job {job_arn} finished with status {status}")
+        
+        for record_id, filename in record_ids.items():
+            raw_text = responses.get(record_id)
+            structured_data = self.parse_response(raw_text, cache_paths[filename]) if raw_text else None
+            if structured_data:
+                self.save_structured_data(filename, structured_data)
+            results[filename] = structured_data
+        
+        return results
+
 def main():
     """Main function to process all transcripts or a specific one"""
     import argparse
@@ -187,6 +450,10 @@ def main():
     parser = argparse.ArgumentParser(description='Structure Spanish transcripts')
     parser.add_argument('--file', '-f', help='Specific transcript file to process')
     parser.add_argument('--all', '-a', action='store_true', help='Process all transcript files')
+    parser.add_argument('--batch', '-b', action='store_true',
+                        help='With --all, run the transcripts as one Bedrock batch inference job')
+    parser.add_argument('--force', action='store_true',
+                        help='With --all, also reprocess transcripts that already have a structured file')
     args = parser.parse_args()
     
     structurer = TranscriptStructurer()
@@ -202,20 +469,28 @@ def main():
             print(f"Failed to process {args.file}")
     
     elif args.all:
-        # Process all files
-        transcript_files = structurer.list_transcripts()
-        if not transcript_files:
-            print("No transcript files found")
-            return
-            
-        print(f"Found {len(transcript_files)} transcript files")
-        for filename in transcript_files:
-            print(f"Processing {filename}...")
-            result = structurer.process_transcript(filename)
+        def report(filename, result):
             if result:
                 print(f"Successfully processed {filename}")
             else:
                 print(f"Failed to process {filename}")
+        
+        # Process all files, reporting each one as soon as it finishes
+        if args.batch:
+            try:
+                results = structurer.process_all_batch(force=args.force)
+            except (ValueError, ClientError) as e:
+                print(f"Batch processing failed: {e}")
+                return
+            for filename, result in results.items():
+                report(filename, result)
+        else:
+            results = structurer.process_all_transcripts(force=args.force, on_result=report)
+        if not results:
+            print("No unprocessed transcript files found (use --force to reprocess)")
+            return
+            
+        print(f"Processed {len(results)} transcript files")
     
     else:
         # No arguments provided, show help
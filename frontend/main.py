@@ -3,7 +3,6 @@ from typing import Dict, List
 import json
 from collections import Counter
 import re
-import difflib
 import boto3
 
 from backend.chat import BedrockChat
@@ -24,6 +23,11 @@ if 'transcript' not in st.session_state:
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+@st.cache_resource(show_spinner="Loading learning assistant...")
+def get_assistant() -> LanguageLearningAssistant:
+    """Create the Language Learning Assistant once and share it across reruns and sessions"""
+    return LanguageLearningAssistant()
+
 def render_header():
     """Render the header section"""
     st.title("🇪🇸 Spanish Learning Assistant")
@@ -169,16 +173,22 @@ def count_characters(text):
     """Count Spanish and total characters in text"""
     if not text:
         return 0, 0
-        
-    def is_spanish(char):
-        return any([
-            char in 'áéíóúñü¿¡',
-            char.isalpha()
-        ])
     
-    sp_chars = sum(1 for char in text if is_spanish(char))
+    # Letters (accented ones included) plus the inverted punctuation marks,
+    # map and str.count loop in C instead of a Python-level generator
+    sp_chars = sum(map(str.isalpha, text)) + text.count('¿') + text.count('¡')
     return sp_chars, len(text)
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def compute_stats(transcript: str) -> Dict[str, int]:
+    """Compute transcript stats once per transcript instead of on every rerun"""
+    sp_chars, total_chars = count_characters(transcript)
+    return {
+        "sp_chars": sp_chars,
+        "total_chars": total_chars,
+        "total_lines": transcript.count('\n') + 1
+    }
+
 def render_transcript_stage():
     """Render the raw transcript stage"""
     st.header("Raw Transcript Processing")
@@ -197,7 +207,7 @@ def render_transcript_stage():
                 transcript = downloader.get_transcript(url)
                 if transcript:
                     # Store the raw transcript text in session state
-                    transcript_text = "\n".join([entry['text'] for entry in transcript])
+                    transcript_text = "\n".join(entry['text'] for entry in transcript)
                     st.session_state.transcript = transcript_text
                     st.success("Transcript downloaded successfully!")
                 else:
@@ -224,13 +234,12 @@ def render_transcript_stage():
         st.subheader("Transcript Stats")
         if st.session_state.transcript:
             # Calculate stats
-            sp_chars, total_chars = count_characters(st.session_state.transcript)
-            total_lines = len(st.session_state.transcript.split('\n'))
+            stats = compute_stats(st.session_state.transcript)
             
             # Display stats
-            st.metric("Total Characters", total_chars)
-            st.metric("Spanish Characters", sp_chars)
-            st.metric("Total Lines", total_lines)
+            st.metric("Total Characters", stats["total_chars"])
+            st.metric("Spanish Characters", stats["sp_chars"])
+            st.metric("Total Lines", stats["total_lines"])
         else:
             st.info("Load a transcript to see statistics")
 
@@ -276,13 +285,12 @@ def render_interactive_stage():
     """Render the interactive learning stage"""
     st.header("Interactive Learning")
     
-    # Initialize the Language Learning Assistant if not already done
-    if 'learning_assistant' not in st.session_state:
-        try:
-            st.session_state.learning_assistant = LanguageLearningAssistant()
-        except Exception as e:
-            st.error(f"Error initializing Learning Assistant: {e}")
-            return
+    # Get the shared Language Learning Assistant
+    try:
+        assistant = get_assistant()
+    except Exception as e:
+        st.error(f"Error initializing Learning Assistant: {e}")
+        return
     
     # Practice type selection
     practice_type = st.selectbox(
@@ -300,11 +308,21 @@ def render_interactive_stage():
         if st.button("Generate New Question", type="primary"):
             with st.spinner("Generating question..."):
                 try:
+                    # Show the model output as it streams in
+                    preview = st.empty()
+                    streamed = []
+
+                    def show_progress(text):
+                        streamed.append(text)
+                        preview.code("".join(streamed), language="json")
+
                     # Generate exercise using RAG
-                    exercise = st.session_state.learning_assistant.generate_learning_exercise(
-                        practice_type.lower()
+                    exercise = assistant.generate_learning_exercise(
+                        practice_type.lower(),
+                        on_text=show_progress
                     )
-                    
+                    preview.empty()
+
                     if exercise:
                         # Store the exercise in session state
                         st.session_state.current_exercise = exercise